@@ -9,4 +9,5 @@ db = client["pdf_chat"]
 users_col = db["users"]
 pdfs_col = db["pdfs"]
 pdf_summaries_col = db["pdf_summaries"]
+pdf_pages_col = db["pdf_pages"]
 
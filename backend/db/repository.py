@@ -0,0 +1,340 @@
+import base64
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from backend.db.mongo import pdfs_col, pdf_summaries_col, pdf_pages_col
+
+logger = logging.getLogger(__name__)
+
+MONGO_SLOW_QUERY_MS = float(os.getenv("MONGO_SLOW_QUERY_MS", "50"))
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Only the fields the sidebar actually renders (+ the keyset sort keys)
+PDF_LIST_PROJECTION = {"name": 1, "indexed": 1, "uploaded_at": 1}
+
+
+# --------------------------------------------------
+# Query timing
+# --------------------------------------------------
+# Process-wide totals per operation: {op: {"count", "total_ms", "max_ms"}}
+QUERY_STATS: dict[str, dict] = {}
+
+# Per-request accumulator, installed by the HTTP middleware in main.py
+_request_timings: ContextVar[dict | None] = ContextVar("mongo_request_timings", default=None)
+
+
+def start_request_timing() -> dict:
+    timings = {"count": 0, "total_ms": 0.0}
+    _request_timings.set(timings)
+    return timings
+
+
+def query_stats() -> dict:
+    """
+    QUERY_STATS as {op: {count, avg_ms, max_ms}}, most total time first
+    """
+    ordered = sorted(QUERY_STATS.items(), key=lambda kv: kv[1]["total_ms"], reverse=True)
+    return {
+        op: {
+            "count": stats["count"],
+            "avg_ms": round(stats["total_ms"] / stats["count"], 2),
+            "max_ms": round(stats["max_ms"], 2)
+        }
+        for op, stats in ordered
+    }
+
+
+@asynccontextmanager
+async def timed_query(op: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        stats = QUERY_STATS.setdefault(op, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+        stats["count"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+
+        timings = _request_timings.get()
+        if timings is not None:
+            timings["count"] += 1
+            timings["total_ms"] += elapsed_ms
+
+        if elapsed_ms >= MONGO_SLOW_QUERY_MS:
+            logger.warning("Slow Mongo query %s took %.1f ms", op, elapsed_ms)
+
+
+# --------------------------------------------------
+# Index bootstrap
+# --------------------------------------------------
+async def ensure_indexes():
+    # upload dedupe: {user_id, content_hash}
+    await pdfs_col.create_index(
+        [("user_id", ASCENDING), ("content_hash", ASCENDING)],
+        name="user_content_hash"
+    )
+    # sidebar listing, newest first, keyset-paginated
+    await pdfs_col.create_index(
+        [("user_id", ASCENDING), ("uploaded_at", DESCENDING), ("_id", DESCENDING)],
+        name="user_uploaded_at"
+    )
+    # reference counting / GC: {content_hash} or {pending_content_hash}
+    await pdfs_col.create_index(
+        [("content_hash", ASCENDING)],
+        name="content_hash"
+    )
+    await pdfs_col.create_index(
+        [("pending_content_hash", ASCENDING)],
+        name="pending_content_hash",
+        sparse=True
+    )
+    # /ask looks up {_id, user_id, indexed}; _id is already unique so the
+    # default _id index serves it, user_id/indexed are checked on one doc.
+
+    # summaries: {pdf_id, user_id}. Older deployments could hold duplicate
+    # rows, which would make the unique build fail -> drop those first.
+    await dedupe_summaries()
+    try:
+        await pdf_summaries_col.create_index(
+            [("pdf_id", ASCENDING), ("user_id", ASCENDING)],
+            name="pdf_user",
+            unique=True
+        )
+    except OperationFailure as e:
+        # Never block startup on this; lookups still work, just slower
+        logger.error("Could not create unique summaries index pdf_user: %s", e)
+
+    # citation page store: {index_key, page}
+    await pdf_pages_col.create_index(
+        [("index_key", ASCENDING), ("page", ASCENDING)],
+        name="index_key_page",
+        unique=True
+    )
+
+
+async def dedupe_summaries():
+    """
+    Keep the most recently updated summary per (pdf_id, user_id)
+    """
+    pipeline = [
+        {"$sort": {"updated_at": DESCENDING}},
+        {"$group": {
+            "_id": {"pdf_id": "$pdf_id", "user_id": "$user_id"},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1}
+        }},
+        {"$match": {"count": {"$gt": 1}}}
+    ]
+    async for group in pdf_summaries_col.aggregate(pipeline, allowDiskUse=True):
+        extra_ids = group["ids"][1:]
+        await pdf_summaries_col.delete_many({"_id": {"$in": extra_ids}})
+        logger.warning(
+            "Removed %d duplicate summaries for %s",
+            len(extra_ids), group["_id"]
+        )
+
+
+# --------------------------------------------------
+# PDFs
+# --------------------------------------------------
+async def find_pdf_by_hash(user_id: str, content_hash: str):
+    async with timed_query("pdfs.find_by_hash"):
+        return await pdfs_col.find_one(
+            {"user_id": user_id, "content_hash": content_hash},
+            {"_id": 1}
+        )
+
+
+async def insert_pdf(doc: dict):
+    async with timed_query("pdfs.insert"):
+        await pdfs_col.insert_one(doc)
+
+
+async def mark_pdf_indexed(pdf_id: str):
+    async with timed_query("pdfs.mark_indexed"):
+        await pdfs_col.update_one(
+            {"_id": pdf_id},
+            {"$set": {"indexed": True}}
+        )
+
+
+async def find_indexed_pdf(pdf_id: str, user_id: str, projection: dict | None = None):
+    async with timed_query("pdfs.find_indexed"):
+        return await pdfs_col.find_one(
+            {"_id": pdf_id, "user_id": user_id, "indexed": True},
+            projection or {"_id": 1}
+        )
+
+
+async def find_user_pdf(pdf_id: str, user_id: str, projection: dict | None = None):
+    async with timed_query("pdfs.find_user_pdf"):
+        return await pdfs_col.find_one(
+            {"_id": pdf_id, "user_id": user_id},
+            projection or {"_id": 1}
+        )
+
+
+async def delete_pdf(pdf_id: str, user_id: str):
+    async with timed_query("pdfs.delete"):
+        await pdfs_col.delete_one({"_id": pdf_id, "user_id": user_id})
+
+
+async def count_pdfs_with_hash(content_hash: str) -> int:
+    # A PDF mid-update references both its current and its pending content
+    async with timed_query("pdfs.count_by_hash"):
+        return await pdfs_col.count_documents({
+            "$or": [
+                {"content_hash": content_hash},
+                {"pending_content_hash": content_hash}
+            ]
+        })
+
+
+async def set_pending_content(pdf_id: str, content_hash: str):
+    async with timed_query("pdfs.set_pending"):
+        await pdfs_col.update_one(
+            {"_id": pdf_id},
+            {"$set": {"pending_content_hash": content_hash}}
+        )
+
+
+async def clear_pending_content(pdf_id: str):
+    async with timed_query("pdfs.clear_pending"):
+        await pdfs_col.update_one(
+            {"_id": pdf_id},
+            {"$unset": {"pending_content_hash": ""}}
+        )
+
+
+async def swap_pdf_content(pdf_id: str, content_hash: str, index_key: str, name: str):
+    async with timed_query("pdfs.swap_content"):
+        await pdfs_col.update_one(
+            {"_id": pdf_id},
+            {
+                "$set": {
+                    "content_hash": content_hash,
+                    "index_key": index_key,
+                    "name": name,
+                    "updated_at": datetime.now(timezone.utc)
+                },
+                "$unset": {"pending_content_hash": ""}
+            }
+        )
+
+
+def encode_cursor(doc: dict) -> str:
+    raw = json.dumps([doc["uploaded_at"].isoformat(), doc["_id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        uploaded_at, pdf_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(uploaded_at), pdf_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+async def list_user_pdfs(user_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None):
+    """
+    Keyset pagination over (uploaded_at desc, _id desc).
+    Returns (docs, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = {"user_id": user_id}
+
+    if cursor:
+        uploaded_at, pdf_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"uploaded_at": {"$lt": uploaded_at}},
+            {"uploaded_at": uploaded_at, "_id": {"$lt": pdf_id}},
+        ]
+
+    async with timed_query("pdfs.list"):
+        docs = await (
+            pdfs_col.find(query, PDF_LIST_PROJECTION)
+            .sort([("uploaded_at", DESCENDING), ("_id", DESCENDING)])
+            .limit(limit + 1)
+            .to_list(length=limit + 1)
+        )
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1])
+
+    return docs, next_cursor
+
+
+# --------------------------------------------------
+# Summaries
+# --------------------------------------------------
+async def find_summary(pdf_id: str, user_id: str, projection: dict | None = None):
+    async with timed_query("summaries.find"):
+        return await pdf_summaries_col.find_one(
+            {"pdf_id": pdf_id, "user_id": user_id},
+            projection
+        )
+
+
+async def upsert_summary(pdf_id: str, user_id: str, summary_doc: dict):
+    async with timed_query("summaries.upsert"):
+        await pdf_summaries_col.update_one(
+            {"pdf_id": pdf_id, "user_id": user_id},
+            {"$set": summary_doc},
+            upsert=True
+        )
+
+
+async def mark_summary_stale(pdf_id: str, user_id: str):
+    async with timed_query("summaries.mark_stale"):
+        await pdf_summaries_col.update_one(
+            {"pdf_id": pdf_id, "user_id": user_id},
+            {"$set": {"stale": True}}
+        )
+
+
+async def delete_summary(pdf_id: str, user_id: str):
+    async with timed_query("summaries.delete"):
+        await pdf_summaries_col.delete_one({"pdf_id": pdf_id, "user_id": user_id})
+
+
+# --------------------------------------------------
+# Pages (text + citation spans), keyed by index so
+# every copy of the same PDF shares one set
+# --------------------------------------------------
+async def replace_pages(index_key: str, pages: list[dict]):
+    # Written once per index, under the content lock
+    async with timed_query("pages.replace"):
+        await pdf_pages_col.delete_many({"index_key": index_key})
+        if pages:
+            await pdf_pages_col.insert_many(
+                [{"index_key": index_key, **p} for p in pages],
+                ordered=False
+            )
+
+
+async def find_page(index_key: str, page: int):
+    async with timed_query("pages.find"):
+        return await pdf_pages_col.find_one(
+            {"index_key": index_key, "page": page},
+            {"_id": 0, "page": 1, "text": 1, "spans": 1}
+        )
+
+
+async def delete_pages(index_keys: list[str]):
+    if not index_keys:
+        return
+    async with timed_query("pages.delete"):
+        await pdf_pages_col.delete_many({"index_key": {"$in": index_keys}})
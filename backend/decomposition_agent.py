@@ -0,0 +1,111 @@
+import json
+import re
+
+from backend.llm_gateway import gateway, Priority
+
+MAX_SUB_QUERIES = 4
+MAX_MERGED_CHUNKS = 20
+
+COMPARATIVE_MARKERS = (
+    "compare", "compared", "comparing", "comparison", "contrast", "difference",
+    "differences", "differ", "differs", "versus", "vs", "similarities",
+    "relationship between", "both", "respectively", "pros and cons",
+    "advantages and disadvantages",
+)
+# Whole words only: "differ" must not match "different", "both" not "bothered"
+COMPARATIVE_PATTERN = re.compile(
+    r"\b(" + "|".join(re.escape(m) for m in COMPARATIVE_MARKERS) + r")\b"
+)
+QUESTION_WORDS = ("what", "why", "how", "who", "when", "where", "which")
+
+
+def needs_decomposition(question: str) -> bool:
+    """
+    Cheap gate: only comparative / multi-part questions pay for the extra LLM call
+    """
+    q = f" {question.lower().strip()} "
+
+    if question.count("?") > 1:
+        return True
+
+    if COMPARATIVE_PATTERN.search(q):
+        return True
+
+    # "What was X and why did Y ..." -> two question words joined by and/or
+    words = re.findall(r"[a-z]+", q)
+    if len(words) >= 12 and sum(w in QUESTION_WORDS for w in words) >= 2:
+        return bool(re.search(r"\b(and|or|also)\b", q))
+
+    return False
+
+
+def decompose_question(question: str) -> list[str]:
+    prompt = f"""
+You split complex questions about a document into simple search queries.
+
+Rules:
+- Return between 2 and {MAX_SUB_QUERIES} sub-questions.
+- Each sub-question must be answerable on its own from the document.
+- Keep the names and terms used in the original question.
+- Do NOT answer the question.
+
+Return ONLY a valid JSON array of strings.
+
+Question:
+{question}
+"""
+    content = gateway.chat(prompt, temperature=0, priority=Priority.INTERACTIVE)
+
+    try:
+        sub_queries = json.loads(content)
+    except Exception:
+        return []
+
+    if not isinstance(sub_queries, list):
+        return []
+
+    return [
+        q.strip() for q in sub_queries
+        if isinstance(q, str) and q.strip()
+    ][:MAX_SUB_QUERIES]
+
+
+def plan_queries(question: str) -> list[str]:
+    """
+    Original question first, then sub-queries (if the gate lets it through)
+    """
+    queries = [question]
+
+    if needs_decomposition(question):
+        seen = {question.strip().lower()}
+        for sub in decompose_question(question):
+            if sub.lower() not in seen:
+                seen.add(sub.lower())
+                queries.append(sub)
+
+    return queries
+
+
+def merge_hits(distances, ids, min_sim: float, limit: int = MAX_MERGED_CHUNKS):
+    """
+    Round-robin across the per-query result rows so every sub-query gets
+    represented, dropping duplicates and weak matches.
+    Returns [(chunk_id, similarity)].
+    """
+    merged = []
+    seen = set()
+
+    for rank in range(ids.shape[1]):
+        for row in range(ids.shape[0]):
+            i = int(ids[row][rank])
+            if i == -1 or i in seen:
+                continue
+            sim = 1 - distances[row][rank] / 2
+            if sim < min_sim:
+                continue
+            seen.add(i)
+            merged.append((i, float(sim)))
+            if len(merged) >= limit:
+                return merged
+
+    return merged
@@ -0,0 +1,29 @@
+"""
+Deterministic stand-ins for model output, shared by the in-process
+FakeProvider (LLM_PROVIDER=fake) and loadtest/fake_openai.py.
+Same text -> same embedding / same answer.
+"""
+import hashlib
+import json
+
+import numpy as np
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+
+
+def fake_answer(prompt: str) -> str:
+    if "You are a verifier" in prompt:
+        return json.dumps({"supported": True, "strength": "strong"})
+    if "You split complex questions" in prompt:
+        # decompose_question expects a JSON array of sub-questions
+        question = prompt.rsplit("Question:", 1)[-1].strip()
+        return json.dumps([f"{question} (first part)", f"{question} (second part)"])
+    digest = hashlib.sha256(prompt.encode()).hexdigest()[:12]
+    return f"Fake answer (ref {digest}). This response was generated without a model."
+
+
+def fake_embedding(text: str, dim: int) -> list[float]:
+    v = np.random.default_rng(_seed(text)).standard_normal(dim).astype("float32")
+    return (v / np.linalg.norm(v)).tolist()
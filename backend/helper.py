@@ -1,18 +1,25 @@
 import hashlib
 import numpy as np
-import os
-from openai import OpenAI
 import re
 from nltk.tokenize import sent_tokenize
+from backend.llm_gateway import gateway, Priority
 
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-embed_model = os.getenv("EMBED_MODEL", "text-embedding-3-large")    
-
 def compute_pdf_hash(file_bytes: bytes) -> str:
     return hashlib.sha256(file_bytes).hexdigest()
 
-def embed_texts(texts: list[str], batch_size: int = 100) -> np.ndarray:
+def chunk_hash_id(text: str) -> int:
+    """
+    Stable FAISS id for a chunk: same text -> same id across PDF versions
+    """
+    digest = hashlib.sha256(text.strip().encode()).digest()
+    return int.from_bytes(digest[:8], "little") & 0x7FFF_FFFF_FFFF_FFFF
+
+def embed_texts(
+    texts: list[str],
+    batch_size: int = 100,
+    priority: Priority = Priority.INGESTION
+) -> np.ndarray:
     clean_texts = [t.strip() for t in texts if isinstance(t, str) and len(t.strip()) > 20]
     if not clean_texts:
         raise ValueError("No valid text chunks to embed")
@@ -21,24 +28,27 @@ def embed_texts(texts: list[str], batch_size: int = 100) -> np.ndarray:
 
     for i in range(0, len(clean_texts), batch_size):
         batch = clean_texts[i:i + batch_size]
-        response = client.embeddings.create(
-            model=embed_model,
-            input=batch
-        )
-        batch_vectors = [d.embedding for d in response.data]
-        all_embeddings.extend(batch_vectors)
+        all_embeddings.extend(gateway.embed(batch, priority=priority))
 
     return np.array(all_embeddings, dtype="float32")
 
-def embed_query(text: str) -> np.ndarray:
-    if not isinstance(text, str) or not text.strip():
+def embed_queries(texts: list[str], priority: Priority = Priority.INTERACTIVE) -> np.ndarray:
+    """
+    Several queries, one provider call
+    """
+    clean = [t.strip() for t in texts if isinstance(t, str) and t.strip()]
+    if not clean:
         raise ValueError("Empty query")
 
-    response = client.embeddings.create(
-        model=embed_model,
-        input=text.strip()
-    )
-    return np.array([response.data[0].embedding], dtype="float32")
+    vectors = gateway.embed(clean, priority=priority)
+    return np.array(vectors, dtype="float32")
+
+def normalize_question(text: str) -> str:
+    """
+    Canonical form used to coalesce duplicate questions
+    """
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip("?!. ")
 
 def normalize_markdown(text: str) -> str:
     # Fix headings
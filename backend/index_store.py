@@ -0,0 +1,172 @@
+import json
+import os
+import pickle
+import re
+import shutil
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from backend.db import repository
+from backend.helper import chunk_hash_id
+from backend.llm_gateway import EMBED_MODEL
+from backend.singleflight import acquire_lock, release_lock
+
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "uploads"))
+INDEX_ROOT = Path(os.getenv("INDEX_ROOT", "/data/indexes"))
+SHARED_INDEX_ROOT = INDEX_ROOT / "shared"
+
+# Bump whenever chunking output changes; old indexes are then rebuilt on upload
+CHUNKING_VERSION = "v3"
+# v3 indexes are IndexIDMap2 keyed by chunk_hash_id, documents.pkl is {id: chunk}
+ID_SCHEME = "chunk_hash"
+
+
+# --------------------------------------------------
+# Keys & paths
+# --------------------------------------------------
+def index_key(content_hash: str) -> str:
+    """
+    Same bytes + same chunking + same embedding model -> same index,
+    whoever uploaded it.
+    """
+    model_slug = re.sub(r"[^A-Za-z0-9]+", "-", EMBED_MODEL)
+    return f"{content_hash}-{CHUNKING_VERSION}-{model_slug}"
+
+
+def shared_index_dir(key: str) -> Path:
+    return SHARED_INDEX_ROOT / key
+
+
+def legacy_index_dir(user_id: str, pdf_id: str) -> Path:
+    # Per-user layout used before indexes were shared
+    return INDEX_ROOT / user_id / pdf_id
+
+
+def resolve_index_dir(doc: dict) -> Path:
+    if doc.get("index_key"):
+        return shared_index_dir(doc["index_key"])
+    return legacy_index_dir(doc["user_id"], doc["_id"])
+
+
+def upload_path(content_hash: str) -> Path:
+    return UPLOAD_DIR / f"{content_hash}.pdf"
+
+
+# --------------------------------------------------
+# Read / write
+# --------------------------------------------------
+def index_exists(index_dir: Path) -> bool:
+    return (index_dir / "index.faiss").exists()
+
+
+def load_index(index_dir: Path):
+    index = faiss.read_index(str(index_dir / "index.faiss"))
+    with open(index_dir / "documents.pkl", "rb") as f:
+        documents = pickle.load(f)
+    return index, documents
+
+
+def ordered_chunks(documents) -> list[dict]:
+    # {id: chunk} (v3) keeps document order; older indexes are plain lists
+    return list(documents.values()) if isinstance(documents, dict) else documents
+
+
+def load_chunk_ids(index_dir: Path) -> set[int]:
+    with open(index_dir / "documents.pkl", "rb") as f:
+        documents = pickle.load(f)
+    if isinstance(documents, dict):
+        return set(documents)
+    return {chunk_hash_id(d["text"]) for d in documents}
+
+
+def load_reusable_vectors(previous_dir: Path, wanted_ids: set[int]):
+    """
+    Start a new index from a previous version's vectors.
+    Returns (index | None, reused_ids, removed_count).
+    """
+    if previous_dir is None or not index_exists(previous_dir):
+        return None, set(), 0
+
+    old_index, old_documents = load_index(previous_dir)
+
+    if load_meta(previous_dir).get("id_scheme") == ID_SCHEME:
+        old_ids = faiss.vector_to_array(old_index.id_map)
+        keep = np.isin(old_ids, np.fromiter(wanted_ids, dtype="int64"))
+        stale = old_ids[~keep]
+        if len(stale):
+            old_index.remove_ids(stale)
+        return old_index, set(old_ids[keep].tolist()), len(stale)
+
+    # Positional index from before chunk ids: copy matching rows across.
+    # Only safe when rows line up with documents.pkl one to one.
+    if len(old_documents) != old_index.ntotal:
+        return None, set(), 0
+
+    rows = {}
+    for row, d in enumerate(old_documents):
+        chunk_id = chunk_hash_id(d["text"])
+        if chunk_id in wanted_ids and chunk_id not in rows:
+            rows[chunk_id] = row
+
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(old_index.d))
+    if rows:
+        vectors = old_index.reconstruct_n(0, old_index.ntotal)[list(rows.values())]
+        index.add_with_ids(vectors, np.fromiter(rows.keys(), dtype="int64"))
+    return index, set(rows), old_index.ntotal - len(rows)
+
+
+def load_meta(index_dir: Path) -> dict:
+    meta_path = index_dir / "meta.json"
+    if not meta_path.exists():
+        return {}
+    return json.loads(meta_path.read_text())
+
+
+def write_index(index_dir: Path, index, documents, meta: dict):
+    """
+    Write into a temp dir and rename, so readers never see a half-built index
+    """
+    tmp_dir = index_dir.with_name(index_dir.name + ".tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    faiss.write_index(index, str(tmp_dir / "index.faiss"))
+    with open(tmp_dir / "documents.pkl", "wb") as f:
+        pickle.dump(documents, f)
+    (tmp_dir / "meta.json").write_text(json.dumps(meta))
+
+    shutil.rmtree(index_dir, ignore_errors=True)
+    tmp_dir.rename(index_dir)
+
+
+# --------------------------------------------------
+# Locking & garbage collection
+# --------------------------------------------------
+def content_lock_name(content_hash: str) -> str:
+    # Held while building or collecting anything derived from these bytes
+    return f"content:{content_hash}"
+
+
+async def collect_garbage(content_hash: str) -> bool:
+    """
+    Drop the upload, shared indexes and page store for content that no
+    pdfs_col document references any more. Returns True if anything was removed.
+    """
+    token = await acquire_lock(content_lock_name(content_hash))
+    try:
+        if await repository.count_pdfs_with_hash(content_hash) > 0:
+            return False
+
+        keys = []
+        if SHARED_INDEX_ROOT.exists():
+            for path in SHARED_INDEX_ROOT.glob(f"{content_hash}-*"):
+                keys.append(path.name)
+                shutil.rmtree(path, ignore_errors=True)
+
+        upload_path(content_hash).unlink(missing_ok=True)
+        await repository.delete_pages(keys)
+        return True
+    finally:
+        await release_lock(content_lock_name(content_hash), token)
@@ -1,24 +1,15 @@
-from openai import OpenAI
 from dotenv import load_dotenv
-import os
 import json
 
 load_dotenv()
 
-client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY")
-)
+from backend.llm_gateway import gateway, Priority
 
 # --------------------------------------------------
 # Core LLM Call
 # --------------------------------------------------
-def generate_answer(prompt: str):
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.2
-    )
-    return response.choices[0].message.content.strip()
+def generate_answer(prompt: str, priority: Priority = Priority.INTERACTIVE):
+    return gateway.chat(prompt, temperature=0.2, priority=priority).strip()
 
 
 # --------------------------------------------------
@@ -83,11 +74,17 @@ Answer:
 """
 
 
-def answer_question(context: str, question: str, history: list, answer_mode: str = "strict"):
+def answer_question(
+    context: str,
+    question: str,
+    history: list,
+    answer_mode: str = "strict",
+    priority: Priority = Priority.INTERACTIVE
+):
     prompt = build_prompt(context, question, history, answer_mode)
-    answer_text = generate_answer(prompt)
+    answer_text = generate_answer(prompt, priority)
 
-    verification = verify_answer(answer_text, context)
+    verification = verify_answer(answer_text, context, priority)
 
     if verification["supported"]:
         if verification["strength"] == "strong":
@@ -110,7 +107,7 @@ def answer_question(context: str, question: str, history: list, answer_mode: str
 # --------------------------------------------------
 # VERIFICATION STEP (ANTI-HALLUCINATION)
 # --------------------------------------------------
-def verify_answer(answer: str, context: str):
+def verify_answer(answer: str, context: str, priority: Priority = Priority.INTERACTIVE):
     prompt = f"""
 You are a verifier.
 
@@ -134,28 +131,14 @@ Return ONLY valid JSON:
 }}
 """
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0
-    )
+    content = gateway.chat(prompt, temperature=0, priority=priority)
 
     try:
-        return json.loads(response.choices[0].message.content)
+        return json.loads(content)
     except Exception:
         return {"supported": False, "strength": "none"}
 
 def stream_answer(context: str, question: str, history: list, answer_mode: str):
     prompt = build_prompt(context, question, history, answer_mode)
 
-    stream = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}],
-        temperature=0.2,
-        stream=True
-    )
-
-    for chunk in stream:
-        delta = chunk.choices[0].delta
-        if delta and delta.content:
-            yield delta.content
+    yield from gateway.chat_stream(prompt, temperature=0.2)
@@ -0,0 +1,319 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from enum import IntEnum
+
+import httpx
+import openai
+from openai import OpenAI
+
+from backend.fake_llm import fake_answer, fake_embedding
+
+logger = logging.getLogger(__name__)
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # "openai" | "fake"
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
+EMBED_MODEL = os.getenv("EMBED_MODEL", "text-embedding-3-large")
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# Slots the non-interactive lanes may use; the rest is reserved for /ask
+LLM_BACKGROUND_CONCURRENCY = int(os.getenv("LLM_BACKGROUND_CONCURRENCY", "8"))
+# Threads for blocking background gateway calls. Must exceed the background
+# slots so waiters queue inside PrioritySlots (priority order), not FIFO here
+LLM_BACKGROUND_THREADS = int(
+    os.getenv("LLM_BACKGROUND_THREADS", str(4 * LLM_BACKGROUND_CONCURRENCY))
+)
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "3000"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+
+FAKE_EMBED_DIM = int(os.getenv("FAKE_EMBED_DIM", "3072"))
+FAKE_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
+
+
+class Priority(IntEnum):
+    # lower value wins
+    INTERACTIVE = 0
+    INGESTION = 1
+    BATCH = 2
+    SUMMARY = 3
+
+
+# --------------------------------------------------
+# Concurrency: priority-ordered slots
+# --------------------------------------------------
+class PrioritySlots:
+    def __init__(self, limit: int, background_limit: int):
+        self._limit = limit
+        self._background_limit = min(background_limit, limit)
+        self._active = 0
+        self._active_background = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _has_room(self, priority: Priority) -> bool:
+        if self._active >= self._limit:
+            return False
+        if priority != Priority.INTERACTIVE:
+            return self._active_background < self._background_limit
+        return True
+
+    def _can_enter(self, entry) -> bool:
+        priority = entry[0]
+        if not self._has_room(priority):
+            return False
+        # Nobody with a higher priority (or same priority, earlier) may enter first
+        for other in self._waiters:
+            if other < entry and self._has_room(other[0]):
+                return False
+        return True
+
+    def acquire(self, priority: Priority):
+        with self._cond:
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiters, entry)
+            while not self._can_enter(entry):
+                self._cond.wait()
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            self._active += 1
+            if priority != Priority.INTERACTIVE:
+                self._active_background += 1
+
+    def release(self, priority: Priority):
+        with self._cond:
+            self._active -= 1
+            if priority != Priority.INTERACTIVE:
+                self._active_background -= 1
+            self._cond.notify_all()
+
+
+# --------------------------------------------------
+# Rate limiting: token bucket with 429 backoff
+# --------------------------------------------------
+class TokenBucket:
+    def __init__(self, rate_per_minute: float):
+        self._rate = rate_per_minute / 60.0
+        self._capacity = max(1.0, self._rate)  # ~1s burst
+        self._tokens = self._capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def take(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._capacity,
+                    self._tokens + (now - self._updated) * self._rate
+                )
+                self._updated = now
+
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                wait = max(
+                    self._paused_until - now,
+                    (1 - self._tokens) / self._rate
+                )
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        """Provider said slow down: hold back every caller, not just this one."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+# --------------------------------------------------
+# Providers
+# --------------------------------------------------
+class OpenAIProvider:
+    RETRYABLE = (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+    def __init__(self):
+        http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONCURRENCY,
+                max_keepalive_connections=LLM_MAX_CONCURRENCY
+            ),
+            timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=10.0)
+        )
+        self.client = OpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=http_client,
+            max_retries=0,  # retries are handled by the gateway
+            timeout=LLM_TIMEOUT_SECONDS
+        )
+
+    def chat(self, messages, model, temperature):
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature
+        )
+        return response.choices[0].message.content
+
+    def chat_stream(self, messages, model, temperature):
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            stream=True
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta and delta.content:
+                yield delta.content
+
+    def embed(self, inputs, model):
+        response = self.client.embeddings.create(model=model, input=inputs)
+        return [d.embedding for d in response.data]
+
+    @staticmethod
+    def retry_after(error) -> float | None:
+        response = getattr(error, "response", None)
+        if response is None:
+            return None
+        try:
+            return float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return None
+
+
+class FakeProvider:
+    """
+    Deterministic, network-free stand-in for load tests and local runs.
+    Same text -> same embedding / same answer.
+    """
+    RETRYABLE = ()
+
+    def _sleep(self):
+        if FAKE_LATENCY_MS:
+            time.sleep(FAKE_LATENCY_MS / 1000)
+
+    def _answer(self, messages) -> str:
+        return fake_answer(messages[-1]["content"])
+
+    def chat(self, messages, model, temperature):
+        self._sleep()
+        return self._answer(messages)
+
+    def chat_stream(self, messages, model, temperature):
+        self._sleep()
+        for word in self._answer(messages).split(" "):
+            yield word + " "
+
+    def embed(self, inputs, model):
+        self._sleep()
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        return [fake_embedding(text, FAKE_EMBED_DIM) for text in inputs]
+
+    @staticmethod
+    def retry_after(error) -> float | None:
+        return None
+
+
+# --------------------------------------------------
+# Gateway
+# --------------------------------------------------
+class LLMGateway:
+    def __init__(self, provider):
+        self.provider = provider
+        self.slots = PrioritySlots(LLM_MAX_CONCURRENCY, LLM_BACKGROUND_CONCURRENCY)
+        self.bucket = TokenBucket(LLM_REQUESTS_PER_MINUTE)
+
+    def _call(self, fn, priority: Priority):
+        self.slots.acquire(priority)
+        try:
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                self.bucket.take()
+                try:
+                    return fn()
+                except self.provider.RETRYABLE as e:
+                    if attempt == LLM_MAX_RETRIES:
+                        raise
+                    delay = min(30.0, 0.5 * 2 ** attempt) * (0.5 + random.random())
+                    retry_after = self.provider.retry_after(e)
+                    if isinstance(e, openai.RateLimitError):
+                        delay = max(delay, retry_after or 0)
+                        self.bucket.pause(delay)
+                    logger.warning(
+                        "LLM call failed (%s), retry %d in %.1fs",
+                        type(e).__name__, attempt + 1, delay
+                    )
+                    time.sleep(delay)
+        finally:
+            self.slots.release(priority)
+
+    def chat(self, prompt: str, temperature: float = 0.2,
+             priority: Priority = Priority.INTERACTIVE, model: str = CHAT_MODEL) -> str:
+        messages = [{"role": "user", "content": prompt}]
+        return self._call(
+            lambda: self.provider.chat(messages, model, temperature),
+            priority
+        )
+
+    def chat_stream(self, prompt: str, temperature: float = 0.2,
+                    priority: Priority = Priority.INTERACTIVE, model: str = CHAT_MODEL):
+        # The slot is held until the stream is drained or closed.
+        # Streams are not retried: tokens may already have been sent.
+        messages = [{"role": "user", "content": prompt}]
+        self.slots.acquire(priority)
+        try:
+            self.bucket.take()
+            yield from self.provider.chat_stream(messages, model, temperature)
+        finally:
+            self.slots.release(priority)
+
+    def embed(self, inputs: list[str], priority: Priority = Priority.INTERACTIVE,
+              model: str = EMBED_MODEL) -> list[list[float]]:
+        return self._call(
+            lambda: self.provider.embed(inputs, model),
+            priority
+        )
+
+
+def _build_provider():
+    if LLM_PROVIDER == "fake":
+        return FakeProvider()
+    return OpenAIProvider()
+
+
+gateway = LLMGateway(_build_provider())
+
+
+# --------------------------------------------------
+# Background executor
+# --------------------------------------------------
+# Non-interactive lanes block inside PrioritySlots.acquire. On anyio's shared
+# threadpool those waiters would fill it up and /ask would queue before ever
+# reaching the gateway, so background gateway calls get their own pool.
+# Only functions that are (almost) all gateway calls belong here; CPU work
+# such as PDF parsing stays on the regular threadpool.
+_background_executor = ThreadPoolExecutor(
+    max_workers=max(LLM_BACKGROUND_THREADS, LLM_BACKGROUND_CONCURRENCY + 1),
+    thread_name_prefix="llm-background"
+)
+
+
+async def run_in_background_pool(fn, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_background_executor, functools.partial(fn, *args))
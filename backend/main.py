@@ -1,22 +1,33 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from pathlib import Path
+from contextlib import asynccontextmanager
+import asyncio
+import json
 import fitz
 import numpy as np
 import faiss
-import pickle
+import shutil
 from backend.chat_memory import get_chat_history, save_chat_message,reset_chat
 from nltk.tokenize import sent_tokenize
 from backend.llm import answer_question, verify_answer  # ✅ IMPORTANT
-from backend.helper import compute_pdf_hash, embed_texts,embed_query, normalize_markdown, clean_context, dedupe_chunks
+from backend.helper import compute_pdf_hash, chunk_hash_id, embed_texts,embed_queries, normalize_markdown, clean_context, dedupe_chunks, normalize_question
+from backend.decomposition_agent import plan_queries, merge_hits
 from backend.auth.dependencies import get_current_user
 from fastapi import Depends
 from backend.routes.auth import auth_router
 from backend.routes.pdfs import pdf_router
 from backend.routes.summaries import router as summaries_router
+from backend.summary_agent import revalidate_summary
 from backend.llm import stream_answer
-from backend.db.mongo import pdfs_col
+from backend.llm_gateway import Priority, run_in_background_pool
+from backend.db import repository
+from backend.singleflight import single_flight, acquire_lock, release_lock
+from backend import index_store
+from backend.index_store import UPLOAD_DIR, INDEX_ROOT
 from datetime import datetime, timezone
 from uuid import uuid4
 
@@ -24,10 +35,10 @@ from uuid import uuid4
 EMBED_DIM = 3072
 MAX_CHARS = 900
 OVERLAP_CHARS = 150
+MAX_BATCH_QUESTIONS = 100   # one embedding request (same batch size as embed_texts)
+BATCH_CONCURRENCY = 4
 
 # -------------------- CONFIG --------------------
-UPLOAD_DIR = Path("uploads")
-INDEX_ROOT = Path("/data/indexes")
 max_chars = int(MAX_CHARS)
 overlap_chars = int(OVERLAP_CHARS)
 
@@ -35,7 +46,13 @@ UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 INDEX_ROOT.mkdir(parents=True, exist_ok=True)
 
 # -------------------- APP --------------------
-app = FastAPI(title="PDF RAG Chat Backend")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await repository.ensure_indexes()
+    yield
+
+
+app = FastAPI(title="PDF RAG Chat Backend", lifespan=lifespan)
 
 app.include_router(auth_router)
 app.include_router(pdf_router)
@@ -48,10 +65,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["Content-Type"],
+    expose_headers=["Content-Type", "X-Next-Cursor", "Server-Timing"],
 )
 
 
+@app.middleware("http")
+async def mongo_timing(request: Request, call_next):
+    timings = repository.start_request_timing()
+    response = await call_next(request)
+    response.headers["Server-Timing"] = (
+        f'mongo;dur={timings["total_ms"]:.1f};desc="{timings["count"]} queries"'
+    )
+    return response
+
+
 # -------------------- HELPERS --------------------
 def extract_pages(pdf_path: Path):
     pages = []
@@ -77,22 +104,47 @@ def split_paragraphs(text: str):
     return paragraphs
 
 
-def build_semantic_chunks(paragraphs):
+def build_semantic_chunks(paragraphs, page_text: str = ""):
+    """
+    Returns [{"text", "char_start", "char_end"}], offsets into page_text
+    """
     chunks = []
     current_chunk = ""
+    chunk_start = 0
+    chunk_end = 0
+    cursor = 0
 
     for para in paragraphs:
         sentences = sent_tokenize(para)
 
         for sentence in sentences:
+            # sent_tokenize returns verbatim slices, so they can be located in order
+            pos = page_text.find(sentence, cursor)
+            if pos == -1:
+                pos = cursor
+            end = pos + len(sentence)
+            cursor = end
+
             if len(current_chunk) + len(sentence) <= max_chars:
+                if not current_chunk:
+                    chunk_start = pos
                 current_chunk += " " + sentence
             else:
-                chunks.append(current_chunk.strip())
+                chunks.append({
+                    "text": current_chunk.strip(),
+                    "char_start": chunk_start,
+                    "char_end": chunk_end
+                })
                 current_chunk = sentence[-overlap_chars:]
+                chunk_start = end - len(current_chunk)
+            chunk_end = end
 
     if current_chunk:
-        chunks.append(current_chunk.strip())
+        chunks.append({
+            "text": current_chunk.strip(),
+            "char_start": chunk_start,
+            "char_end": chunk_end
+        })
 
     return chunks
 
@@ -103,22 +155,142 @@ def semantic_chunk_pdf(pdf_path: Path, source_name: str):
 
     for page_data in pages:
         paragraphs = split_paragraphs(page_data["text"])
-        semantic_chunks = build_semantic_chunks(paragraphs)
+        semantic_chunks = build_semantic_chunks(paragraphs, page_data["text"])
 
         for chunk in semantic_chunks:
             chunks.append({
-                "text": chunk,
+                "text": chunk["text"],
                 "source": source_name,
-                "page": page_data["page"]
+                "page": page_data["page"],
+                "char_start": chunk["char_start"],
+                "char_end": chunk["char_end"]
             })
 
-    return chunks
+    return chunks, pages
+
+def build_page_store(pages, chunks, chunk_ids):
+    """
+    Per-page text + [chunk_id, char_start, char_end] spans for citation highlights
+    """
+    spans = {}
+    for chunk_id, c in zip(chunk_ids, chunks):
+        spans.setdefault(c["page"], []).append([chunk_id, c["char_start"], c["char_end"]])
+
+    return [
+        {
+            "page": p["page"],
+            "text": p["text"],
+            "spans": spans.get(p["page"], [])
+        }
+        for p in pages
+    ]
 
 def cosine_similarity(normalized_query, normalized_vectors):
     """
     Since embeddings are normalized, cosine similarity = dot product
     """
     return np.dot(normalized_query, normalized_vectors.T)
+
+def load_chunks(pdf_path: Path, source_name: str):
+    """
+    Parse and chunk a PDF. Returns (chunks, chunk_ids, documents, pages);
+    documents is {chunk_id: chunk} with repeated text stored once.
+    """
+    chunks, pages = semantic_chunk_pdf(pdf_path, source_name)
+    # Same filter as embed_texts, so every chunk kept here gets a vector
+    chunks = [c for c in chunks if len(c["text"].strip()) > 20]
+    chunk_ids = [chunk_hash_id(c["text"]) for c in chunks]
+
+    # Repeated text (running headers etc.) is stored and embedded once
+    documents = {}
+    for chunk_id, c in zip(chunk_ids, chunks):
+        documents.setdefault(chunk_id, c)
+
+    return chunks, chunk_ids, documents, pages
+
+async def build_index(pdf_path: Path, source_name: str, index_dir: Path, previous_dir: Path | None = None):
+    """
+    Vectors are keyed by chunk_hash_id, so when previous_dir holds an older
+    version of the document only chunks whose text changed get embedded.
+    Parsing and FAISS I/O use the regular threadpool; only the embedding
+    calls go through the gateway's background pool.
+    """
+    chunks, chunk_ids, documents, pages = await run_in_threadpool(load_chunks, pdf_path, source_name)
+
+    # Scanned / blank PDFs: nothing to search, don't mark them indexed
+    if not documents:
+        raise ValueError("No extractable text in PDF")
+
+    index, reused_ids, removed = await run_in_threadpool(
+        index_store.load_reusable_vectors, previous_dir, set(documents)
+    )
+    if index is None:
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(EMBED_DIM))
+
+    new_ids = [chunk_id for chunk_id in documents if chunk_id not in reused_ids]
+    if new_ids:
+        embeddings = await run_in_background_pool(
+            embed_texts, [documents[chunk_id]["text"] for chunk_id in new_ids]
+        )
+        faiss.normalize_L2(embeddings)
+        index.add_with_ids(embeddings, np.array(new_ids, dtype="int64"))
+
+    await run_in_threadpool(index_store.write_index, index_dir, index, documents, {
+        "chunks": len(documents),
+        "id_scheme": index_store.ID_SCHEME
+    })
+
+    stats = {
+        "chunks": len(documents),
+        "reused_chunks": len(reused_ids),
+        "embedded_chunks": len(new_ids),
+        "removed_chunks": removed
+    }
+    page_store = await run_in_threadpool(build_page_store, pages, chunks, chunk_ids)
+    return stats, page_store
+
+async def ensure_shared_index(
+    content_hash: str,
+    file_bytes: bytes,
+    filename: str,
+    previous_dir: Path | None = None
+):
+    """
+    Build the content-addressed index once; every later upload of the same
+    bytes (any user) finds it on disk and returns immediately.
+    """
+    key = index_store.index_key(content_hash)
+    index_dir = index_store.shared_index_dir(key)
+
+    async def build():
+        lock = index_store.content_lock_name(content_hash)
+        token = await acquire_lock(lock)
+        try:
+            if index_store.index_exists(index_dir):
+                chunk_count = index_store.load_meta(index_dir).get("chunks")
+                return {
+                    "chunks": chunk_count,
+                    "reused": True,
+                    "reused_chunks": chunk_count,
+                    "embedded_chunks": 0,
+                    "removed_chunks": 0
+                }
+
+            # Raw PDF is written under the lock so GC can't remove it mid-build
+            pdf_path = index_store.upload_path(content_hash)
+            if not pdf_path.exists():
+                pdf_path.write_bytes(file_bytes)
+
+            try:
+                stats, page_store = await build_index(pdf_path, filename, index_dir, previous_dir)
+            except ValueError as e:
+                raise HTTPException(400, str(e))
+            await repository.replace_pages(key, page_store)
+            return {"reused": False, **stats}
+        finally:
+            await release_lock(lock, token)
+
+    return await single_flight(f"index:{key}", build)
 # -------------------- API MODELS --------------------
 class AskRequest(BaseModel):
     question: str
@@ -126,6 +298,11 @@ class AskRequest(BaseModel):
     pdf_id: str
     answer_mode: str  # "strict" or "hybrid"
 
+class BatchAskRequest(BaseModel):
+    pdf_id: str
+    questions: list[str]
+    answer_mode: str = "strict"
+
 # -------------------- ROUTES --------------------
 
 
@@ -138,11 +315,16 @@ async def upload_pdf(file: UploadFile = File(...), user=Depends(get_current_user
     content_hash = compute_pdf_hash(file_bytes)
     user_id = user["sub"]
 
+    # Double-clicked uploads await the first one instead of indexing twice
+    return await single_flight(
+        f"upload:{user_id}:{content_hash}",
+        lambda: ingest_pdf(user_id, content_hash, file_bytes, file.filename)
+    )
+
+
+async def ingest_pdf(user_id: str, content_hash: str, file_bytes: bytes, filename: str):
     # 🔐 Check if THIS USER already uploaded this PDF
-    existing = await pdfs_col.find_one({
-        "user_id": user_id,
-        "content_hash": content_hash
-    })
+    existing = await repository.find_pdf_by_hash(user_id, content_hash)
 
     if existing:
         return {
@@ -152,96 +334,190 @@ async def upload_pdf(file: UploadFile = File(...), user=Depends(get_current_user
 
     pdf_id = str(uuid4())
 
-    # Store raw PDF (content-based is OK here)
-    pdf_path = UPLOAD_DIR / f"{content_hash}.pdf"
-    if not pdf_path.exists():
-        pdf_path.write_bytes(file_bytes)
-
-    await pdfs_col.insert_one({
+    # Inserted before building so the content is referenced (and safe from GC)
+    await repository.insert_pdf({
         "_id": pdf_id,
         "user_id": user_id,
         "content_hash": content_hash,
-        "name": file.filename,
+        "index_key": index_store.index_key(content_hash),
+        "name": filename,
         "indexed": False,
         "uploaded_at": datetime.now(timezone.utc)
     })
 
-    # 🔐 USER-SCOPED INDEX PATH
-    pdf_index_dir = INDEX_ROOT / user_id / pdf_id
-    pdf_index_dir.mkdir(parents=True, exist_ok=True)
+    # 🔐 Index is shared read-only; access is still checked per user in pdfs_col
+    try:
+        result = await ensure_shared_index(content_hash, file_bytes, filename)
+    except Exception:
+        # Don't leave a PDF that can never be indexed in the sidebar
+        await repository.delete_pdf(pdf_id, user_id)
+        await index_store.collect_garbage(content_hash)
+        raise
+
+    await repository.mark_pdf_indexed(pdf_id)
+
+    return {
+        "pdf_id": pdf_id,
+        "message": "PDF already indexed" if result["reused"] else "PDF uploaded & indexed",
+        "chunks": result["chunks"]
+    }
+
+
+@app.post("/update-pdf/{pdf_id}")
+async def update_pdf(pdf_id: str, file: UploadFile = File(...), user=Depends(get_current_user)):
+    if file.content_type != "application/pdf":
+        raise HTTPException(400, "Only PDF allowed")
+
+    file_bytes = await file.read()
+    content_hash = compute_pdf_hash(file_bytes)
+    user_id = user["sub"]
+
+    return await single_flight(
+        f"update:{pdf_id}:{content_hash}",
+        lambda: reindex_pdf(pdf_id, user_id, content_hash, file_bytes, file.filename)
+    )
 
-    index_path = pdf_index_dir / "index.faiss"
-    docs_path = pdf_index_dir / "documents.pkl"
 
-    chunks = semantic_chunk_pdf(pdf_path, file.filename)
-    texts = [c["text"] for c in chunks if len(c["text"].strip()) > 10]
+async def reindex_pdf(pdf_id: str, user_id: str, content_hash: str, file_bytes: bytes, filename: str):
+    """
+    New revision of an existing PDF: same pdf_id, new content. Chunks are
+    diffed by text hash against the current index, so only changed text is
+    embedded; chat history and still-valid summaries carry over.
+    """
+    # One revision at a time per PDF: two different uploads would otherwise
+    # overwrite each other's pending hash and GC the index the other reads
+    lock = f"pdf-update:{pdf_id}"
+    token = await acquire_lock(lock)
+    try:
+        return await _reindex_pdf(pdf_id, user_id, content_hash, file_bytes, filename)
+    finally:
+        await release_lock(lock, token)
+
+
+async def _reindex_pdf(pdf_id: str, user_id: str, content_hash: str, file_bytes: bytes, filename: str):
+    doc = await repository.find_indexed_pdf(
+        pdf_id, user_id, {"user_id": 1, "content_hash": 1, "index_key": 1}
+    )
+    if not doc:
+        raise HTTPException(404, "PDF not found")
 
-    embeddings = embed_texts(texts)
-    faiss.normalize_L2(embeddings)
+    if doc["content_hash"] == content_hash:
+        return {"pdf_id": pdf_id, "message": "PDF unchanged"}
 
-    index = faiss.IndexFlatL2(EMBED_DIM)
-    index.add(embeddings)
+    previous_hash = doc["content_hash"]
+    previous_dir = index_store.resolve_index_dir(doc)
 
-    faiss.write_index(index, str(index_path))
-    with open(docs_path, "wb") as f:
-        pickle.dump(chunks, f)
+    # Referencing both versions keeps them safe from GC until the swap
+    await repository.set_pending_content(pdf_id, content_hash)
+    try:
+        result = await ensure_shared_index(content_hash, file_bytes, filename, previous_dir)
+    except Exception:
+        await repository.clear_pending_content(pdf_id)
+        await index_store.collect_garbage(content_hash)
+        raise
 
-    await pdfs_col.update_one(
-        {"_id": pdf_id},
-        {"$set": {"indexed": True}}
+    key = index_store.index_key(content_hash)
+    await repository.swap_pdf_content(pdf_id, content_hash, key, filename)
+
+    chunk_ids = await run_in_threadpool(
+        index_store.load_chunk_ids, index_store.shared_index_dir(key)
     )
+    summary_valid = await revalidate_summary(pdf_id, user_id, chunk_ids)
+
+    if not doc.get("index_key"):
+        shutil.rmtree(previous_dir, ignore_errors=True)
+    await index_store.collect_garbage(previous_hash)
 
     return {
         "pdf_id": pdf_id,
-        "message": "PDF uploaded & indexed",
-        "chunks": len(chunks)
+        "message": "PDF updated",
+        "chunks": result["chunks"],
+        "reused_chunks": result["reused_chunks"],
+        "embedded_chunks": result["embedded_chunks"],
+        "removed_chunks": result["removed_chunks"],
+        "summary_valid": summary_valid
     }
 
 
 @app.post("/ask")
-def ask(req: AskRequest, user=Depends(get_current_user)):
+async def ask(req: AskRequest, user=Depends(get_current_user)):
     user_id = user["sub"]
 
-    doc = pdfs_col.find_one({
-        "_id": req.pdf_id,
-        "user_id": user_id,
-        "indexed": True
-    })
+    doc = await repository.find_indexed_pdf(
+        req.pdf_id, user_id, {"user_id": 1, "index_key": 1, "name": 1}
+    )
 
     if not doc:
         raise HTTPException(403, "Access denied")
 
-    pdf_index_dir = INDEX_ROOT / user_id / req.pdf_id
-    index_path = pdf_index_dir / "index.faiss"
-    docs_path = pdf_index_dir / "documents.pkl"
-
-    if not index_path.exists():
-        raise HTTPException(404, "Index missing")
-
-    index = faiss.read_index(str(index_path))
-    with open(docs_path, "rb") as f:
-        documents = pickle.load(f)
-
-    q_emb = embed_query(req.question)
-    faiss.normalize_L2(q_emb)
+    # History is part of the prompt, so only coalesce within a conversation;
+    # index_key keeps answers from a previous version of the PDF out
+    key = ":".join([
+        "ask",
+        req.pdf_id,
+        doc.get("index_key") or "",
+        req.conversation_id,
+        req.answer_mode,
+        normalize_question(req.question)
+    ])
+    return await single_flight(
+        key,
+        lambda: run_in_threadpool(answer_from_index, req, doc)
+    )
 
-    k = min(15, index.ntotal)
-    distances, ids = index.search(q_emb, k)
 
+def build_context(documents, hits, source_name: str | None):
     relevant_chunks = []
     sources = set()
+    citations = []
 
-    for dist, i in zip(distances[0], ids[0]):
-        if i == -1:
-            continue
-        sim = 1 - dist / 2
-        if sim < 0.25:
-            continue
+    for i, _ in hits:
         d = documents[i]
         relevant_chunks.append(d["text"])
-        sources.add(f"{d['source']} (Page {d['page']})")
+        sources.add(f"{source_name or d['source']} (Page {d['page']})")
+        if "char_start" in d:  # indexes built before spans were stored have none
+            citations.append({
+                "chunk_id": str(i),
+                "source": source_name or d["source"],
+                "page": d["page"],
+                "char_start": d["char_start"],
+                "char_end": d["char_end"]
+            })
 
     context = clean_context("\n\n".join(dedupe_chunks(relevant_chunks)))
+    return context, sources, citations
+
+
+def search_index(index, q_emb: np.ndarray, top_k: int = 15):
+    # FAISS asserts k > 0; an empty index simply has no hits
+    k = min(top_k, index.ntotal)
+    if k == 0:
+        empty = (len(q_emb), 0)
+        return np.empty(empty, dtype="float32"), np.empty(empty, dtype="int64")
+    return index.search(q_emb, k)
+
+
+def answer_from_index(req: AskRequest, doc: dict):
+    index_dir = index_store.resolve_index_dir(doc)
+
+    if not index_store.index_exists(index_dir):
+        raise HTTPException(404, "Index missing")
+
+    index, documents = index_store.load_index(index_dir)
+    # Shared indexes hold the first uploader's filename; show this user's
+    source_name = doc.get("name")
+
+    # Simple questions -> [question]; multi-part ones add sub-queries
+    queries = plan_queries(req.question)
+    q_emb = embed_queries(queries)
+    faiss.normalize_L2(q_emb)
+
+    # One search over the whole query matrix (FAISS parallelises across rows)
+    distances, ids = search_index(index, q_emb)
+
+    context, sources, citations = build_context(
+        documents, merge_hits(distances, ids, min_sim=0.25), source_name
+    )
     history = get_chat_history(req.conversation_id)
 
     result = answer_question(context, req.question, history, req.answer_mode)
@@ -253,11 +529,88 @@ def ask(req: AskRequest, user=Depends(get_current_user)):
     return {
         "messages": [{"role": "assistant", "content": normalize_markdown(result["text"])}],
         "confidence": 0.8 if verification["supported"] else 0.3,
-        "sources": list(sources) if verification["supported"] else []
+        "sources": list(sources) if verification["supported"] else [],
+        "citations": citations if verification["supported"] else []
     }
 
 
 
+@app.post("/ask/batch")
+async def ask_batch(req: BatchAskRequest, user=Depends(get_current_user)):
+    """
+    Many questions, one PDF: index loaded once, one embedding call, one FAISS
+    search over the query matrix. Answers stream back as NDJSON in completion
+    order, each line tagged with the question's position.
+    """
+    questions = [q.strip() for q in req.questions]
+    if not questions or any(not q for q in questions):
+        raise HTTPException(400, "Questions must be non-empty")
+    if len(questions) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(400, f"At most {MAX_BATCH_QUESTIONS} questions per batch")
+
+    doc = await repository.find_indexed_pdf(
+        req.pdf_id, user["sub"], {"user_id": 1, "index_key": 1, "name": 1}
+    )
+    if not doc:
+        raise HTTPException(403, "Access denied")
+
+    index_dir = index_store.resolve_index_dir(doc)
+    if not index_store.index_exists(index_dir):
+        raise HTTPException(404, "Index missing")
+
+    index, documents = await run_in_threadpool(index_store.load_index, index_dir)
+
+    q_emb = await run_in_background_pool(embed_queries, questions, Priority.BATCH)
+    faiss.normalize_L2(q_emb)
+
+    distances, ids = await run_in_threadpool(search_index, index, q_emb)
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def answer_one(n: int):
+        context, sources, citations = build_context(
+            documents,
+            merge_hits(distances[n:n + 1], ids[n:n + 1], min_sim=0.25),
+            doc.get("name")
+        )
+        async with semaphore:
+            try:
+                result = await run_in_background_pool(
+                    answer_question, context, questions[n], [], req.answer_mode, Priority.BATCH
+                )
+            except Exception:
+                return {"index": n, "question": questions[n], "error": "Answer generation failed"}
+
+        supported = result["answer_type"] != "GENERAL_KNOWLEDGE"
+        return {
+            "index": n,
+            "question": questions[n],
+            "answer": normalize_markdown(result["text"]),
+            "answer_type": result["answer_type"],
+            "confidence": result["confidence"],
+            "sources": list(sources) if supported else [],
+            "citations": citations if supported else []
+        }
+
+    async def stream():
+        tasks = [asyncio.create_task(answer_one(n)) for n in range(len(questions))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # client went away -> don't keep spending on the rest
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+@app.get("/metrics/mongo")
+async def mongo_metrics(user=Depends(get_current_user)):
+    # Per worker process: with --workers N each worker reports its own totals
+    return repository.query_stats()
+
+
 @app.post("/reset-chat/{conversation_id}")
 def reset_chat_api(conversation_id: str):
     reset_chat(conversation_id)
@@ -1,20 +1,114 @@
-from backend.db.mongo import pdfs_col
+from collections import OrderedDict
+import shutil
+from backend.db import repository
+from backend import index_store
 from backend.auth.dependencies import get_current_user
-from fastapi import Depends
+from fastapi import Depends, Request, Response
 from fastapi import APIRouter, HTTPException
 
 pdf_router = APIRouter(prefix="/pdfs", tags=["pdfs"])
 
+# (index_key, page) -> page payload. Pages are content-addressed and
+# never change, so hot documents are served without touching Mongo again.
+PAGE_CACHE_SIZE = 1024
+_page_cache: OrderedDict = OrderedDict()
+
+
+async def get_cached_page(index_key: str, page: int):
+    key = (index_key, page)
+    if key in _page_cache:
+        _page_cache.move_to_end(key)
+        return _page_cache[key]
+
+    doc = await repository.find_page(index_key, page)
+    if doc is None:
+        return None
+
+    _page_cache[key] = doc
+    if len(_page_cache) > PAGE_CACHE_SIZE:
+        _page_cache.popitem(last=False)
+    return doc
+
 @pdf_router.get("/")
-async def list_pdfs(user=Depends(get_current_user)):
-    cursor = pdfs_col.find({"user_id": user["sub"]})
-    pdfs = []
+async def list_pdfs(
+    response: Response,
+    limit: int = repository.DEFAULT_PAGE_SIZE,
+    cursor: str | None = None,
+    user=Depends(get_current_user)
+):
+    try:
+        docs, next_cursor = await repository.list_user_pdfs(user["sub"], limit, cursor)
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
 
-    async for doc in cursor:
-        pdfs.append({
+    # Body stays a plain list for the sidebar; the next page is in a header
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    return [
+        {
             "id": doc["_id"],
             "name": doc["name"],
-            "indexed": doc.get("indexed", False) 
-        })
+            "indexed": doc.get("indexed", False)
+        }
+        for doc in docs
+    ]
+
+
+@pdf_router.get("/{pdf_id}/pages/{page}")
+async def get_page(
+    pdf_id: str,
+    page: int,
+    request: Request,
+    response: Response,
+    user=Depends(get_current_user)
+):
+    doc = await repository.find_indexed_pdf(pdf_id, user["sub"], {"index_key": 1})
+    if not doc:
+        raise HTTPException(403, "Access denied")
+
+    index_key = doc.get("index_key")
+    if not index_key:
+        raise HTTPException(404, "Page not found")
+
+    # /update-pdf keeps the pdf_id, so the URL alone can't be cached: the
+    # browser revalidates against the index it was built from
+    etag = f'"{index_key}"'
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cache_headers)
+
+    page_doc = await get_cached_page(index_key, page)
+    if not page_doc:
+        raise HTTPException(404, "Page not found")
+
+    response.headers.update(cache_headers)
+    return {
+        "page": page_doc["page"],
+        "text": page_doc["text"],
+        "spans": [
+            # ids are 63-bit; strings survive JSON.parse in the browser
+            {"chunk_id": str(chunk_id), "char_start": start, "char_end": end}
+            for chunk_id, start, end in page_doc["spans"]
+        ]
+    }
+
+
+@pdf_router.delete("/{pdf_id}")
+async def delete_pdf(pdf_id: str, user=Depends(get_current_user)):
+    user_id = user["sub"]
+    doc = await repository.find_user_pdf(pdf_id, user_id, {"content_hash": 1, "index_key": 1})
+    if not doc:
+        raise HTTPException(404, "PDF not found")
+
+    await repository.delete_pdf(pdf_id, user_id)
+    await repository.delete_summary(pdf_id, user_id)
+
+    if not doc.get("index_key"):
+        # per-user index from before indexes were shared
+        shutil.rmtree(index_store.legacy_index_dir(user_id, pdf_id), ignore_errors=True)
+
+    # Last reference gone -> shared index, upload and page store go too
+    collected = await index_store.collect_garbage(doc["content_hash"])
 
-    return pdfs
+    return {"message": "PDF deleted", "content_removed": collected}
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException
-from backend.db.mongo import pdf_summaries_col
+from backend.db import repository
 from backend.auth.dependencies import get_current_user
 from backend.summary_agent import run_summary_agent
 
@@ -8,14 +8,16 @@ router = APIRouter(prefix="/summaries", tags=["summaries"])
 
 @router.get("/{pdf_id}")
 async def get_summary(pdf_id: str, user=Depends(get_current_user)):
-    doc = await pdf_summaries_col.find_one(
-        {"pdf_id": pdf_id, "user_id": user["sub"]},
-        {"_id": 0}
-    )
+    doc = await repository.find_summary(pdf_id, user["sub"], {"_id": 0, "source_chunk_ids": 0})
 
     if not doc:
         raise HTTPException(404, "Summary not found")
 
+    # PDF was updated and its summary no longer matches -> the client's
+    # 404 path POSTs, which regenerates it
+    if doc.get("stale"):
+        raise HTTPException(404, "Summary is stale")
+
     return doc
 
 
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+from uuid import uuid4
+
+from backend.redis_client import async_redis_client
+
+LOCK_TTL_MS = int(os.getenv("SINGLEFLIGHT_LOCK_TTL_MS", str(10 * 60 * 1000)))
+RESULT_TTL_SECONDS = int(os.getenv("SINGLEFLIGHT_RESULT_TTL_SECONDS", "30"))
+POLL_INTERVAL_SECONDS = 0.1
+
+# Compare-and-delete so a worker never releases a lock it no longer owns
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# key -> Future of the call running in THIS worker
+_inflight: dict[str, asyncio.Future] = {}
+
+
+def _lock_key(key: str) -> str:
+    return f"singleflight:lock:{key}"
+
+
+def _result_key(key: str, token: str) -> str:
+    # Per run, so a waiter never picks up an older leader's result
+    return f"singleflight:result:{key}:{token}"
+
+
+async def single_flight(key: str, fn):
+    """
+    Run `fn()` (an async callable) at most once per key across all workers.
+
+    Callers in the same worker await the same Future; callers in other
+    workers wait on the Redis lock and pick up the published result.
+    Results must be JSON serialisable.
+    """
+    while True:
+        inflight = _inflight.get(key)
+        if inflight is None:
+            break
+        try:
+            return await asyncio.shield(inflight)
+        except asyncio.CancelledError:
+            # Only the leader's request went away -> elect a new leader.
+            # If this task is the one being cancelled, let it propagate.
+            if not inflight.cancelled() or asyncio.current_task().cancelling():
+                raise
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+
+    try:
+        result = await _run_once(key, fn)
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        # Followers' clients may still be connected: wake them to retry
+        future.cancel()
+        raise
+    except BaseException as e:
+        future.set_exception(e)
+        # Nobody else awaiting -> don't warn about an unretrieved exception
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+
+async def _run_once(key: str, fn):
+    lock_key = _lock_key(key)
+    token = str(uuid4())
+
+    while True:
+        if await async_redis_client.set(lock_key, token, nx=True, px=LOCK_TTL_MS):
+            try:
+                result = await fn()
+                await async_redis_client.set(
+                    _result_key(key, token),
+                    json.dumps(result, default=str),
+                    ex=RESULT_TTL_SECONDS
+                )
+                return json.loads(json.dumps(result, default=str))
+            finally:
+                await async_redis_client.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+
+        # Another worker owns it: wait for THAT run to finish
+        leader = await async_redis_client.get(lock_key)
+        if leader is None:
+            # Released in between -> try to become the leader
+            continue
+        while await async_redis_client.get(lock_key) == leader:
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+        published = await async_redis_client.get(_result_key(key, leader))
+        if published is not None:
+            return json.loads(published)
+
+        # Leader failed without publishing -> try to become the leader
+
+
+async def acquire_lock(name: str, ttl_ms: int = LOCK_TTL_MS) -> str:
+    """
+    Block until the named lock is held; returns the token release_lock needs
+    """
+    lock_key = _lock_key(name)
+    token = str(uuid4())
+    while not await async_redis_client.set(lock_key, token, nx=True, px=ttl_ms):
+        await asyncio.sleep(POLL_INTERVAL_SECONDS)
+    return token
+
+
+async def release_lock(name: str, token: str):
+    await async_redis_client.eval(_RELEASE_SCRIPT, 1, _lock_key(name), token)
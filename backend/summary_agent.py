@@ -1,17 +1,19 @@
-from backend.db.mongo import pdf_summaries_col
-from backend.helper import clean_context
+from backend.db import repository
+from backend.helper import clean_context, chunk_hash_id
 from backend.llm import answer_question
-from pathlib import Path
-import pickle, faiss
+from backend.llm_gateway import Priority, run_in_background_pool
+from backend import index_store
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from backend.singleflight import single_flight
 from datetime import datetime, timezone
 
 
-def load_index_and_docs(user_id: str, pdf_id: str):
-    base = Path("/data/indexes") / user_id / pdf_id
-    with open(base / "documents.pkl", "rb") as f:
-        docs = pickle.load(f)
-    index = faiss.read_index(str(base / "index.faiss"))
-    return index, docs
+async def load_index_and_docs(user_id: str, pdf_id: str):
+    doc = await repository.find_indexed_pdf(pdf_id, user_id, {"user_id": 1, "index_key": 1})
+    if not doc:
+        raise HTTPException(404, "PDF not found")
+    return await run_in_threadpool(index_store.load_index, index_store.resolve_index_dir(doc))
 
 
 async def run_summary_agent(
@@ -19,26 +21,38 @@ async def run_summary_agent(
     user_id: str,
     force: bool = False
 ):
-    existing = await pdf_summaries_col.find_one({
-        "pdf_id": pdf_id,
-        "user_id": user_id
-    })
+    # create + regenerate share one key, so either waits for a running one
+    return await single_flight(
+        f"summary:{pdf_id}",
+        lambda: _run_summary_agent(pdf_id, user_id, force)
+    )
+
+
+async def _run_summary_agent(
+    pdf_id: str,
+    user_id: str,
+    force: bool = False
+):
+    existing = await repository.find_summary(pdf_id, user_id)
 
-    if existing and not force:
+    if existing and not force and not existing.get("stale"):
         return existing
 
-    _, docs = load_index_and_docs(user_id, pdf_id)
+    _, documents = await load_index_and_docs(user_id, pdf_id)
+    docs = index_store.ordered_chunks(documents)
 
     # Use distributed chunks, not only first ones
-    rep_chunks = docs[::max(1, len(docs) // 25)]
-    rep_text = clean_context("\n\n".join(d["text"] for d in rep_chunks[:30]))
+    rep_chunks = docs[::max(1, len(docs) // 25)][:30]
+    rep_text = clean_context("\n\n".join(d["text"] for d in rep_chunks))
 
     # -------- Overview --------
-    overview_resp = answer_question(
+    overview_resp = await run_in_background_pool(
+        answer_question,
         rep_text,
         "Give a concise, high-level summary of this document.",
         [],
-        "hybrid"
+        "hybrid",
+        Priority.SUMMARY
     )
 
     overview = overview_resp["text"].strip()
@@ -69,11 +83,13 @@ Summary:
 {overview}
 """
 
-    questions_resp = answer_question(
+    questions_resp = await run_in_background_pool(
+        answer_question,
         overview,
         questions_prompt,
         [],
-        "hybrid"
+        "hybrid",
+        Priority.SUMMARY
     )
 
     questions = [
@@ -90,18 +106,34 @@ Summary:
         "user_id": user_id,
         "overview": overview,
         "suggested_questions": suggested_questions,
+        # the summary stays valid across document updates while these survive
+        "source_chunk_ids": [chunk_hash_id(d["text"]) for d in rep_chunks],
+        "stale": False,
         "version": version,
         "updated_at": datetime.now(timezone.utc)
     }
 
-    await pdf_summaries_col.update_one(
-        {"pdf_id": pdf_id, "user_id": user_id},
-        {"$set": summary_doc},
-        upsert=True
-    )
+    await repository.upsert_summary(pdf_id, user_id, summary_doc)
 
     return summary_doc
 
+async def revalidate_summary(pdf_id: str, user_id: str, chunk_ids: set[int]):
+    """
+    After a document update: keep the summary if every chunk it was built
+    from is still in the new version, otherwise mark it stale so the next
+    request regenerates it. Returns None when there is no summary.
+    """
+    existing = await repository.find_summary(pdf_id, user_id, {"source_chunk_ids": 1})
+    if not existing:
+        return None
+
+    source_ids = existing.get("source_chunk_ids")
+    if source_ids and set(source_ids) <= chunk_ids:
+        return True
+
+    await repository.mark_summary_stale(pdf_id, user_id)
+    return False
+
 def clean_questions(questions: list[str]) -> list[str]:
     cleaned = []
     for q in questions:
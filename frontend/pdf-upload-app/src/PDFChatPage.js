@@ -7,6 +7,8 @@ import Sidebar from "./components/Sidebar";
 import MessageList from "./components/MessageList";
 import InputBar from "./components/InputBar";
 
+const PDF_PAGE_SIZE = 50;
+
 export default function ChatPdf({ onLogout }) {
     const token = localStorage.getItem("app_token");
     const user = token ? jwtDecode(token) : null;
@@ -62,34 +64,45 @@ export default function ChatPdf({ onLogout }) {
     /* ---------------- LOAD PDFs ---------------- */
     useEffect(() => {
         if (!token) return;
+        let cancelled = false;
 
-        fetch(`${API_URL}/pdfs/`, {
-            headers: { Authorization: `Bearer ${token}` }
-        })
-            .then(res => res.json())
-            .then(data => {
-                const mapped = data.map(p => ({
-                    id: p.id,
-                    name: p.name,
-                    indexed: p.indexed,
-                    indexing: p.indexing ?? false
-                }));
-
-                setPdfs(mapped);
-
-                // 🔥 Restore active PDF correctly AFTER pdfs are loaded
-                const saved = localStorage.getItem(chatKey);
-                if (saved) {
-                    const parsed = JSON.parse(saved);
-                    if (parsed.activePdfId) {
-                        const restored = mapped.find(p => p.id === parsed.activePdfId);
-                        if (restored) {
-                            setActivePdf(restored); // now has full object including 'indexed'
-                        }
-                    }
+        const saved = localStorage.getItem(chatKey);
+        const savedActiveId = saved ? JSON.parse(saved).activePdfId : null;
+
+        // Keyset-paginated: render each page as it arrives, follow X-Next-Cursor
+        const loadPage = async (cursor) => {
+            const params = new URLSearchParams({ limit: PDF_PAGE_SIZE });
+            if (cursor) params.set("cursor", cursor);
+
+            const res = await fetch(`${API_URL}/pdfs/?${params}`, {
+                headers: { Authorization: `Bearer ${token}` }
+            });
+            const data = await res.json();
+            if (cancelled) return;
+
+            const mapped = data.map(p => ({
+                id: p.id,
+                name: p.name,
+                indexed: p.indexed,
+                indexing: p.indexing ?? false
+            }));
+
+            setPdfs(prev => cursor ? [...prev, ...mapped] : mapped);
+
+            // 🔥 Restore active PDF correctly once its page is loaded
+            if (savedActiveId) {
+                const restored = mapped.find(p => p.id === savedActiveId);
+                if (restored) {
+                    setActivePdf(restored); // now has full object including 'indexed'
                 }
-            })
-            .catch(console.error);
+            }
+
+            const next = res.headers.get("X-Next-Cursor");
+            if (next) await loadPage(next);
+        };
+
+        loadPage(null).catch(console.error);
+        return () => { cancelled = true; };
     }, [API_URL, chatKey, token]);
 
 
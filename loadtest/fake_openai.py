@@ -0,0 +1,117 @@
+"""
+Minimal OpenAI-compatible server for load tests.
+
+Serves /v1/embeddings and /v1/chat/completions (incl. stream=true) with
+configurable latency and deterministic output, so the backend runs its real
+OpenAI client + gateway code path without network or API spend.
+
+    python -m loadtest.fake_openai --port 9100 --chat-latency-ms 800 --embed-latency-ms 150
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from backend.fake_llm import fake_answer, fake_embedding
+
+app = FastAPI(title="Fake OpenAI")
+config = {
+    "chat_latency_ms": 800.0,
+    "embed_latency_ms": 150.0,
+    "jitter": 0.2,
+    "embed_dim": 3072,
+    "stream_chunks": 20,
+}
+
+
+async def _sleep(base_ms: float):
+    jitter = config["jitter"]
+    await asyncio.sleep(base_ms * random.uniform(1 - jitter, 1 + jitter) / 1000)
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body["input"]
+    if isinstance(inputs, str):
+        inputs = [inputs]
+
+    await _sleep(config["embed_latency_ms"])
+
+    data = [
+        {"object": "embedding", "index": i, "embedding": fake_embedding(text, config["embed_dim"])}
+        for i, text in enumerate(inputs)
+    ]
+
+    return {
+        "object": "list",
+        "data": data,
+        "model": body.get("model"),
+        "usage": {"prompt_tokens": 0, "total_tokens": 0},
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    text = fake_answer(prompt)
+    created = int(time.time())
+    base = {"id": "chatcmpl-fake", "created": created, "model": body.get("model")}
+
+    if not body.get("stream"):
+        await _sleep(config["chat_latency_ms"])
+        return JSONResponse({
+            **base,
+            "object": "chat.completion",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    async def stream():
+        words = text.split(" ")
+        per_chunk = max(1, len(words) // config["stream_chunks"])
+        for i in range(0, len(words), per_chunk):
+            await _sleep(config["chat_latency_ms"] / config["stream_chunks"])
+            piece = " ".join(words[i:i + per_chunk]) + " "
+            chunk = {
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--chat-latency-ms", type=float, default=config["chat_latency_ms"])
+    parser.add_argument("--embed-latency-ms", type=float, default=config["embed_latency_ms"])
+    parser.add_argument("--jitter", type=float, default=config["jitter"], help="+/- fraction of latency")
+    parser.add_argument("--embed-dim", type=int, default=config["embed_dim"])
+    args = parser.parse_args()
+
+    config.update(
+        chat_latency_ms=args.chat_latency_ms,
+        embed_latency_ms=args.embed_latency_ms,
+        jitter=args.jitter,
+        embed_dim=args.embed_dim,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
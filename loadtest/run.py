@@ -0,0 +1,400 @@
+"""
+End-to-end load test: fake OpenAI + backend + mixed upload/ask/summary traffic.
+
+    python -m loadtest.run --rps 20 --duration 60
+    python -m loadtest.run --rps 50 --duration 120 --mongo mongodb://localhost:27017 --workers 4
+    python -m loadtest.run --target http://localhost:8000 --server-pid 1234   # already running
+
+Traffic is open-loop: requests are launched on a fixed schedule at --rps
+whether or not earlier ones finished, so queueing inside the app shows up as
+latency instead of silently lowering the offered load.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import fitz
+import httpx
+import psutil
+from jose import jwt
+
+ROOT = Path(__file__).resolve().parent.parent
+WORDS = (
+    "empire policy trade river dynasty edict council army harvest temple "
+    "treaty province tax coin scholar archive reform border monsoon script"
+).split()
+
+
+# --------------------------------------------------
+# Fixtures
+# --------------------------------------------------
+def make_token(user_id: str, secret: str) -> str:
+    payload = {
+        "sub": user_id,
+        "email": f"{user_id}@loadtest.local",
+        "exp": datetime.now(timezone.utc) + timedelta(hours=12),
+    }
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+def make_pdf(rng: random.Random, pages: int) -> bytes:
+    doc = fitz.open()
+    for page_num in range(1, pages + 1):
+        sentences = [
+            " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 16))).capitalize() + "."
+            for _ in range(rng.randint(15, 25))
+        ]
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(40, 40, 560, 800), f"Chapter {page_num}\n\n" + " ".join(sentences), fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+# --------------------------------------------------
+# Process management
+# --------------------------------------------------
+def spawn(args: list[str], env: dict) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", *args], cwd=ROOT, env=env)
+
+
+async def wait_ready(url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url, timeout=2)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.3)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+class ResourceSampler:
+    """CPU% and RSS of the server process and its workers"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.root = psutil.Process(pid)
+        self.interval = interval
+        self.cpu = []
+        self.rss_mb = []
+        self._task = None
+
+    def _procs(self):
+        return [self.root, *self.root.children(recursive=True)]
+
+    async def _run(self):
+        for p in self._procs():
+            p.cpu_percent(None)
+        while True:
+            await asyncio.sleep(self.interval)
+            cpu = rss = 0.0
+            for p in self._procs():
+                try:
+                    cpu += p.cpu_percent(None)
+                    rss += p.memory_info().rss
+                except psutil.NoSuchProcess:
+                    continue
+            self.cpu.append(cpu)
+            self.rss_mb.append(rss / 2**20)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+# --------------------------------------------------
+# Load generation
+# --------------------------------------------------
+class Recorder:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.latencies = defaultdict(list)
+        self.mongo_ms = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint: str, started: float, response: httpx.Response | None):
+        if response is None or response.status_code >= 400:
+            self.errors[endpoint] += 1
+            return
+        self.latencies[endpoint].append((time.perf_counter() - started) * 1000)
+        timing = response.headers.get("server-timing", "")
+        if "mongo;dur=" in timing:
+            self.mongo_ms[endpoint].append(float(timing.split("dur=")[1].split(";")[0]))
+
+
+class LoadGenerator:
+    def __init__(self, args, client: httpx.AsyncClient, recorder: Recorder):
+        self.args = args
+        self.client = client
+        self.recorder = recorder
+        self.rng = random.Random(args.seed)
+        self.users = [f"loadtest-user-{i}" for i in range(args.users)]
+        self.headers = {
+            u: {"Authorization": f"Bearer {make_token(u, args.secret_key)}"} for u in self.users
+        }
+        # A small corpus reused across users exercises dedupe / shared indexes
+        self.corpus = [make_pdf(self.rng, args.pdf_pages) for _ in range(args.corpus_size)]
+        self.pdfs = defaultdict(list)  # user -> [pdf_id]
+
+    async def _request(self, endpoint: str, method: str, url: str, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            response = None
+        self.recorder.record(endpoint, started, response)
+        return response
+
+    async def upload(self, user: str):
+        pdf = self.rng.choice(self.corpus)
+        if self.rng.random() >= self.args.dup_ratio:
+            pdf = make_pdf(self.rng, self.args.pdf_pages)
+        response = await self._request(
+            "upload", "POST", "/upload-pdf",
+            headers=self.headers[user],
+            files={"file": ("loadtest.pdf", pdf, "application/pdf")},
+        )
+        if response is not None and response.status_code == 200:
+            pdf_id = response.json()["pdf_id"]
+            if pdf_id not in self.pdfs[user]:
+                self.pdfs[user].append(pdf_id)
+
+    async def ask(self, user: str):
+        if not self.pdfs[user]:
+            return await self.upload(user)
+        question = self.rng.choice([
+            "What is the main argument of chapter 1?",
+            "Who introduced the tax reform?",
+            "Compare the treaty with the border policy",
+            "What happened to the archive and why did the council act?",
+        ])
+        await self._request(
+            "ask", "POST", "/ask",
+            headers=self.headers[user],
+            json={
+                "question": question,
+                "conversation_id": f"{user}-{self.rng.randint(0, 9)}",
+                "pdf_id": self.rng.choice(self.pdfs[user]),
+                "answer_mode": "strict",
+            },
+        )
+
+    async def summary(self, user: str):
+        if not self.pdfs[user]:
+            return await self.upload(user)
+        await self._request(
+            "summary", "POST", f"/summaries/{self.rng.choice(self.pdfs[user])}",
+            headers=self.headers[user],
+        )
+
+    async def mongo_stats(self) -> dict | None:
+        # Server-side per-operation Mongo totals (one worker's view)
+        try:
+            response = await self.client.get("/metrics/mongo", headers=self.headers[self.users[0]])
+        except httpx.HTTPError:
+            return None
+        return response.json() if response.status_code == 200 else None
+
+    async def warmup(self):
+        await asyncio.gather(*(self.upload(u) for u in self.users))
+        self.recorder.reset()  # warmup doesn't count
+
+    async def run(self):
+        actions = [self.upload, self.ask, self.summary]
+        weights = [self.args.mix_upload, self.args.mix_ask, self.args.mix_summary]
+        total = int(self.args.rps * self.args.duration)
+        start = time.perf_counter()
+        tasks = []
+
+        for i in range(total):
+            delay = start + i / self.args.rps - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            action = self.rng.choices(actions, weights)[0]
+            tasks.append(asyncio.create_task(action(self.rng.choice(self.users))))
+
+        await asyncio.gather(*tasks)
+        return time.perf_counter() - start
+
+
+# --------------------------------------------------
+# Report
+# --------------------------------------------------
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))]
+
+
+def build_report(recorder: Recorder, elapsed: float, sampler: ResourceSampler | None, args) -> dict:
+    endpoints = {}
+    for endpoint in sorted(set(recorder.latencies) | set(recorder.errors)):
+        lat = recorder.latencies[endpoint]
+        endpoints[endpoint] = {
+            "ok": len(lat),
+            "errors": recorder.errors[endpoint],
+            "throughput_rps": round(len(lat) / elapsed, 2),
+            "p50_ms": round(percentile(lat, 50), 1),
+            "p95_ms": round(percentile(lat, 95), 1),
+            "p99_ms": round(percentile(lat, 99), 1),
+            "mongo_p50_ms": round(percentile(recorder.mongo_ms[endpoint], 50), 2),
+        }
+
+    report = {
+        "target_rps": args.rps,
+        "duration_s": round(elapsed, 1),
+        "achieved_rps": round(sum(e["ok"] for e in endpoints.values()) / elapsed, 2),
+        "endpoints": endpoints,
+    }
+    if sampler and sampler.cpu:
+        report["server"] = {
+            "cpu_avg_pct": round(sum(sampler.cpu) / len(sampler.cpu), 1),
+            "cpu_max_pct": round(max(sampler.cpu), 1),
+            "rss_max_mb": round(max(sampler.rss_mb), 1),
+        }
+    return report
+
+
+def print_report(report: dict):
+    print(f"\ntarget {report['target_rps']} rps for {report['duration_s']}s "
+          f"-> achieved {report['achieved_rps']} rps\n")
+    print(f"{'endpoint':<10}{'ok':>7}{'err':>6}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'mongo p50':>11}")
+    for name, e in report["endpoints"].items():
+        print(f"{name:<10}{e['ok']:>7}{e['errors']:>6}{e['throughput_rps']:>8}"
+              f"{e['p50_ms']:>9}{e['p95_ms']:>9}{e['p99_ms']:>9}{e['mongo_p50_ms']:>11}")
+    if "server" in report:
+        s = report["server"]
+        print(f"\nserver cpu avg {s['cpu_avg_pct']}% max {s['cpu_max_pct']}%, rss max {s['rss_max_mb']} MB")
+    if "mongo_ops" in report:
+        print(f"\n{'mongo op':<24}{'count':>8}{'avg ms':>9}{'max ms':>9}")
+        for op, m in list(report["mongo_ops"].items())[:8]:
+            print(f"{op:<24}{m['count']:>8}{m['avg_ms']:>9}{m['max_ms']:>9}")
+
+
+# --------------------------------------------------
+# Main
+# --------------------------------------------------
+async def run(args):
+    procs = []
+    target = args.target
+    server_pid = args.server_pid
+
+    if not target:
+        # Start from empty index/upload dirs every run: the seeded corpus has
+        # the same content hashes each time, and leftover shared indexes would
+        # turn every upload into "already indexed"
+        if args.data_dir:
+            shutil.rmtree(args.data_dir, ignore_errors=True)
+            data_dir = Path(args.data_dir)
+        else:
+            data_dir = Path(tempfile.mkdtemp(prefix="pdf-chat-loadtest-"))
+        env = {
+            **os.environ,
+            "SECRET_KEY": args.secret_key,
+            "REDIS_URL": args.redis_url,
+            "OPENAI_API_KEY": "loadtest",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{args.openai_port}/v1",
+            "INDEX_ROOT": str(data_dir / "indexes"),
+            "UPLOAD_DIR": str(data_dir / "uploads"),
+        }
+        procs.append(spawn([
+            "loadtest.fake_openai", "--port", str(args.openai_port),
+            "--chat-latency-ms", str(args.chat_latency_ms),
+            "--embed-latency-ms", str(args.embed_latency_ms),
+        ], env))
+        server = spawn([
+            "loadtest.serve", "--port", str(args.port),
+            "--mongo", args.mongo, "--workers", str(args.workers),
+        ], env)
+        procs.append(server)
+        server_pid = server.pid
+        target = f"http://127.0.0.1:{args.port}"
+        await wait_ready(f"http://127.0.0.1:{args.openai_port}/docs")
+
+    try:
+        await wait_ready(f"{target}/openapi.json")
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+        async with httpx.AsyncClient(base_url=target, timeout=args.timeout, limits=limits) as client:
+            recorder = Recorder()
+            generator = LoadGenerator(args, client, recorder)
+            await generator.warmup()
+
+            sampler = ResourceSampler(server_pid) if server_pid else None
+            if sampler:
+                sampler.start()
+            elapsed = await generator.run()
+            if sampler:
+                await sampler.stop()
+
+            mongo_ops = await generator.mongo_stats()
+
+        report = build_report(recorder, elapsed, sampler, args)
+        if mongo_ops:
+            report["mongo_ops"] = mongo_ops
+        print_report(report)
+        if args.json:
+            Path(args.json).write_text(json.dumps(report, indent=2))
+    finally:
+        for p in procs:
+            p.terminate()
+        for p in procs:
+            p.wait(timeout=10)
+        if procs and not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=10)
+    parser.add_argument("--duration", type=float, default=30, help="seconds")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--mix-upload", type=float, default=0.1)
+    parser.add_argument("--mix-ask", type=float, default=0.8)
+    parser.add_argument("--mix-summary", type=float, default=0.1)
+    parser.add_argument("--corpus-size", type=int, default=5, help="PDFs shared across users")
+    parser.add_argument("--dup-ratio", type=float, default=0.7, help="share of uploads drawn from the corpus")
+    parser.add_argument("--pdf-pages", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--json", help="also write the report to this file")
+
+    stack = parser.add_argument_group("local stack (ignored with --target)")
+    stack.add_argument("--port", type=int, default=8100)
+    stack.add_argument("--openai-port", type=int, default=9100)
+    stack.add_argument("--chat-latency-ms", type=float, default=800)
+    stack.add_argument("--embed-latency-ms", type=float, default=150)
+    stack.add_argument("--mongo", default="mock", help='"mock" or a MongoDB URI')
+    stack.add_argument("--workers", type=int, default=1)
+    stack.add_argument("--redis-url", default=os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0"))
+    stack.add_argument("--data-dir", help="index/upload dir, wiped at start (default: fresh temp dir)")
+
+    existing = parser.add_argument_group("existing deployment")
+    existing.add_argument("--target", help="base URL of an already running backend")
+    existing.add_argument("--server-pid", type=int, help="pid to sample CPU/memory from")
+    parser.add_argument("--secret-key", default=os.getenv("SECRET_KEY", "loadtest-secret"))
+
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
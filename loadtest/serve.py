@@ -0,0 +1,55 @@
+"""
+Run the backend for load tests.
+
+    python -m loadtest.serve --port 8100 --mongo mock
+    python -m loadtest.serve --port 8100 --mongo mongodb://localhost:27017 --workers 4
+
+--mongo mock swaps the Motor client for mongomock before the app is imported
+(single worker only, the data lives in-process). Anything else is used as
+MONGO_URI. Redis always comes from REDIS_URL (a local redis-server is fine).
+"""
+import argparse
+import os
+
+import uvicorn
+
+
+def use_mongomock():
+    from mongomock_motor import AsyncMongoMockClient
+    import backend.db.mongo as mongo
+
+    mongo.client = AsyncMongoMockClient()
+    mongo.db = mongo.client["pdf_chat"]
+    mongo.users_col = mongo.db["users"]
+    mongo.pdfs_col = mongo.db["pdfs"]
+    mongo.pdf_summaries_col = mongo.db["pdf_summaries"]
+    mongo.pdf_pages_col = mongo.db["pdf_pages"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--mongo", default="mock", help='"mock" or a MongoDB URI')
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.mongo == "mock":
+        if args.workers != 1:
+            parser.error("--mongo mock keeps data in-process; use --workers 1")
+        use_mongomock()
+        from backend.main import app
+        uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    else:
+        os.environ["MONGO_URI"] = args.mongo
+        uvicorn.run(
+            "backend.main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            log_level="warning"
+        )
+
+
+if __name__ == "__main__":
+    main()